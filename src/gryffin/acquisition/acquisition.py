@@ -468,6 +468,13 @@ class Acquisition(Logger):
         acquisition = self.acquisition_functions[batch_index]
         return acquisition(x)
 
+    def eval_acquisition_batch(self, X, batch_index):
+        """Evaluate the acquisition for all samples in X, with shape (num_samples, num_dims), and return the
+        acquisition values as an array of shape (num_samples,)"""
+        acquisition = self.acquisition_functions[batch_index]
+        # the kernels are evaluated one sample at a time, so we fill the output array directly from the iterator
+        return np.fromiter((acquisition(x) for x in X), dtype=np.float64, count=len(X))
+
     def _feasibility_constraint(self, param_dict):
         x = param_dict_to_vector(param_dict, param_names=self.config.param_names,
                                  param_options=self.config.param_options, param_types=self.config.param_types)
@@ -4,6 +4,27 @@ __author__ = 'Florian Hase, Matteo Aldeghi'
 
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional: without it, the Adam step below runs as plain numpy code
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True)
+def _adam_step(sample, grads, ms, vs, eta_next, beta_1, beta_2, epsilon):
+    """Single Adam update, returns the updated sample and moment vectors."""
+    # m(t) = beta1 * m(t-1) + (1 – beta1) * g(t)
+    ms_next = (beta_1 * ms) + (1. - beta_1) * grads
+    # v(t) = beta2 * v(t-1) + (1 – beta2) * g(t)^2
+    vs_next = (beta_2 * vs) + (1. - beta_2) * np.square(grads)
+    # update sample: x(t) = x(t-1) – eta(t) * m(t) / (sqrt(v(t)) + eps)
+    sample_next = sample - eta_next * ms_next / (np.sqrt(vs_next) + epsilon)
+    return sample_next, ms_next, vs_next
+
 
 class AdamOptimizer:
 
@@ -121,13 +142,13 @@ class AdamOptimizer:
         # where: beta(t) = beta^t
         eta_next = eta * (np.sqrt(1. - np.power(self.beta_2, self.iterations)) /
                           (1. - np.power(self.beta_1, self.iterations)))
-        # m(t) = beta1 * m(t-1) + (1 – beta1) * g(t)
-        ms_next = (self.beta_1 * self.ms) + (1. - self.beta_1) * grads
-        # v(t) = beta2 * v(t-1) + (1 – beta2) * g(t)^2
-        vs_next = (self.beta_2 * self.vs) + (1. - self.beta_2) * np.square(grads)
 
-        # update sample: x(t) = x(t-1) – eta(t) * m(t) / (sqrt(v(t)) + eps)
-        sample_next = sample - eta_next * ms_next / (np.sqrt(vs_next) + self.epsilon)
+        # update moments and sample. The float32 gradients are cast to the dtype of the moments, so that the
+        # arithmetic is done in the same precision whether or not _adam_step is compiled: numpy would otherwise
+        # keep the products of python floats and float32 gradients in float32, while numba promotes them
+        grads = grads.astype(self.ms.dtype)
+        sample_next, ms_next, vs_next = _adam_step(sample, grads, self.ms, self.vs, eta_next,
+                                                   self.beta_1, self.beta_2, self.epsilon)
 
         # update params
         self.ms = ms_next
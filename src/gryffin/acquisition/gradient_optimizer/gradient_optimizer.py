@@ -4,7 +4,7 @@ __author__ = 'Florian Hase'
 
 
 import numpy as np
-from gryffin.utilities import Logger
+from gryffin.utilities import Logger, GryffinUnknownSettingsError
 from gryffin.observation_processor import param_vector_to_dict
 from rich.progress import track
 from . import AdamOptimizer, NaiveDiscreteOptimizer, NaiveCategoricalOptimizer
@@ -35,11 +35,27 @@ class GradientOptimizer(Logger):
             self._optimize_one_sample = self._constrained_optimize_sample
 
         # parse positions
-        self.pos_continuous = np.array([True if f == 'continuous' else False for f in self.config.feature_types])
-        self.pos_categories = np.array([True if f == 'categorical' else False for f in self.config.feature_types])
-        self.pos_discrete = np.array([True if f == 'discrete' else False for f in self.config.feature_types])
+        feature_types = np.asarray(self.config.feature_types)
+        self.pos_continuous = feature_types == 'continuous'
+        self.pos_categories = feature_types == 'categorical'
+        self.pos_discrete = feature_types == 'discrete'
         # quick/simple check
-        assert sum(self.pos_continuous) + sum(self.pos_categories) + sum(self.pos_discrete) == self.config.num_features
+        unknown = ~(self.pos_continuous | self.pos_categories | self.pos_discrete)
+        if np.any(unknown):
+            raise GryffinUnknownSettingsError(f'did not understand feature types: {feature_types[unknown]}')
+
+        # which feature types are present does not change, so we check this only once
+        self.has_continuous = bool(np.any(self.pos_continuous))
+        self.has_categorical = bool(np.any(self.pos_categories))
+        self.has_discrete = bool(np.any(self.pos_discrete))
+
+        # cache optimization bounds, the config properties rebuild them at every access
+        self._lowers = self.config.param_lowers
+        self._uppers = self.config.param_uppers
+
+        # indices of the discrete dimensions and feature sizes, used in set_func
+        self._idx_discrete = np.flatnonzero(self.pos_discrete)
+        self._feature_sizes = self.config.feature_sizes
 
         # instantiate optimizers for all variable types
         self.opt_con = AdamOptimizer()
@@ -47,14 +63,13 @@ class GradientOptimizer(Logger):
         self.opt_cat = NaiveCategoricalOptimizer()
 
     def _within_bounds(self, sample):
-        return not (np.any(sample < self.config.param_lowers) or np.any(sample > self.config.param_uppers))
+        return bool(np.all((sample >= self._lowers) & (sample <= self._uppers)))
 
     def _project_sample_onto_bounds(self, sample):
         # project sample onto opt boundaries
         if not self._within_bounds(sample):
-            sample = np.where(sample < self.config.param_lowers, self.config.param_lowers, sample)
-            sample = np.where(sample > self.config.param_uppers, self.config.param_uppers, sample)
-            sample = sample.astype(np.float32)
+            sample = sample.astype(np.float32, copy=False)
+            np.clip(sample, self._lowers, self._uppers, out=sample)
         return sample
 
     def _optimize_continuous(self, sample):
@@ -73,19 +88,22 @@ class GradientOptimizer(Logger):
         return proposal
 
     def set_func(self, kernel, ignores=None):
-        pos_continuous = self.pos_continuous.copy()
-        pos_discrete = self.pos_discrete.copy()
-        pos_categories = self.pos_categories.copy()
-        if ignores is not None:
-            for ignore_index, ignore in enumerate(ignores):
-                if ignore:
-                    pos_continuous[ignore_index] = False
-                    pos_discrete[ignore_index] = False
-                    pos_categories[ignore_index] = False
+        if ignores is None or not np.any(ignores):
+            # nothing to ignore, use the cached positions
+            pos_continuous = self.pos_continuous
+            pos_discrete = self.pos_discrete
+            pos_categories = self.pos_categories
+            idx_discrete = self._idx_discrete
+        else:
+            keep = ~np.asarray(ignores, dtype=bool)
+            pos_continuous = self.pos_continuous & keep
+            pos_discrete = self.pos_discrete & keep
+            pos_categories = self.pos_categories & keep
+            idx_discrete = np.flatnonzero(pos_discrete)
 
         self.opt_con.set_func(kernel, select=pos_continuous)
-        self.opt_dis.set_func(kernel, pos=np.arange(self.config.num_features)[pos_discrete], highest=self.config.feature_sizes[self.pos_discrete])
-        self.opt_cat.set_func(kernel, select=pos_categories, feature_sizes=self.config.feature_sizes)
+        self.opt_dis.set_func(kernel, pos=idx_discrete, highest=self._feature_sizes[idx_discrete])
+        self.opt_cat.set_func(kernel, select=pos_categories, feature_sizes=self._feature_sizes)
 
     def optimize(self, samples, max_iter=10, show_progress=False):
         """Optimise a list of samples
@@ -119,42 +137,52 @@ class GradientOptimizer(Logger):
 
     def _single_opt_iteration(self, optimized):
         # one step of continuous
-        if np.any(self.pos_continuous):
+        if self.has_continuous:
             optimized = self._optimize_continuous(optimized)
 
         # one step of categorical perturbation
-        if np.any(self.pos_categories):
+        if self.has_categorical:
             optimized = self._optimize_categorical(optimized)
 
         # one step of discrete optimization
-        if np.any(self.pos_discrete):
+        if self.has_discrete:
             optimized = self._optimize_discrete(optimized)
 
         return optimized
 
     def _optimize_sample(self, sample, max_iter=10, convergence_dx=1e-7):
 
-        # copy sample
-        sample_copy = sample.copy()
+        # copy sample; the buffers are allocated once and updated in place within the loop. They are float64
+        # like the iterates returned by the optimizers, so that the previous iterate is not rounded to the
+        # (possibly float32) dtype of sample
+        sample_copy = np.array(sample, dtype=np.float64)
         optimized = sample.copy()
+        diff = np.empty_like(sample_copy)
+        convergence_dx_sq = convergence_dx ** 2
         # optimize
         for num_iter in range(max_iter):
             # one step of optimization
             optimized = self._single_opt_iteration(optimized)
             # make sure we're still within the domain
             optimized = self._project_sample_onto_bounds(optimized)
-            # check for convergence
-            if np.any(self.pos_continuous) and np.linalg.norm(sample_copy - optimized) < convergence_dx:
-                break
-            else:
-                sample_copy = optimized.copy()
+            # check for convergence, comparing squared norms to avoid the sqrt
+            if self.has_continuous:
+                np.subtract(sample_copy, optimized, out=diff)
+                if np.dot(diff, diff) < convergence_dx_sq:
+                    break
+            np.copyto(sample_copy, optimized)
         return optimized
 
     def _constrained_optimize_sample(self, sample, max_iter=10, convergence_dx=1e-7):
 
-        # use copy to create a new object, otherwise we have mutable np arrays that keep getting updated
-        prev_optimized = sample.copy()
+        # use copy to create a new object, otherwise we have mutable np arrays that keep getting updated.
+        # The buffers are allocated once and updated in place within the loop. They are float64 like the iterates
+        # returned by the optimizers, so that the last feasible point is returned exactly rather than rounded to
+        # the (possibly float32) dtype of sample
+        prev_optimized = np.array(sample, dtype=np.float64)
         optimized = sample.copy()
+        diff = np.empty_like(prev_optimized)
+        convergence_dx_sq = convergence_dx ** 2
 
         # --------
         # optimize
@@ -171,13 +199,14 @@ class GradientOptimizer(Logger):
             feasible = [constr(param) for constr in self.constraints]
             if not all(feasible):
                 # stop optimization and return last feasible point
-                optimized = prev_optimized.copy()
+                optimized = prev_optimized
                 break
 
-            # check for convergence
-            if np.any(self.pos_continuous) and np.linalg.norm(prev_optimized - optimized) < convergence_dx:
-                break
-            else:
-                prev_optimized = optimized.copy()
+            # check for convergence, comparing squared norms to avoid the sqrt
+            if self.has_continuous:
+                np.subtract(prev_optimized, optimized, out=diff)
+                if np.dot(diff, diff) < convergence_dx_sq:
+                    break
+            np.copyto(prev_optimized, optimized)
         return optimized
 
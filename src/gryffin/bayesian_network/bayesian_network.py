@@ -39,6 +39,7 @@ class BayesianNetwork(Logger):
 
         # variables for kernel density estimation and regression
         self.trace_kernels = None
+        self.trainer = None  # BNNTrainer, kept across calls to reuse its cached training features
         self.cat_reshaper = CategoryReshaper(self.config)
 
         # get kernel types and sizes
@@ -102,12 +103,13 @@ class BayesianNetwork(Logger):
             cm = nullcontext()
 
         with cm:
-            trainer = BNNTrainer(
-                self.config,
-                self.model_details,
-                self.frac_feas
-            )
-            model = trainer.train(obs_params)
+            if self.trainer is None:
+                self.trainer = BNNTrainer(
+                    self.config,
+                    self.model_details,
+                    self.frac_feas
+                )
+            model = self.trainer.train(obs_params)
 
         self.trace_kernels = model.get_kernels()
 
@@ -19,11 +19,26 @@ class BNNTrainer(Logger):
         self.model_details = model_details
         self.frac_feas = frac_feas
 
+        # buffer of encoded features, reused when the same trainer sees a growing set of observations.
+        # Its capacity is doubled when needed, and only its first _cached_n rows are valid
+        self._feat_buf = None
+        self._cached_params = None
+        self._cached_n = 0
+
+        # kernel bounds are fixed by the config, so the rescaling of features/targets can be computed only once
+        self.lower_rescalings = torch.as_tensor(self.config.kernel_lowers, dtype=torch.float32)
+        self.rescale_range = torch.as_tensor(self.config.kernel_uppers, dtype=torch.float32) - self.lower_rescalings
+
         Logger.__init__(self, 'BNNTrainer', verbosity=self.config.get('verbosity'))
 
     def train(self, observed_params):
         torch.manual_seed(0)
-        observed_params = torch.tensor(observed_params)
+        # share memory with the numpy array where possible, copying only if a conversion to float32 is needed.
+        # Features are float32, so this also gives a consistent dtype for the comparison with the cached params
+        if not torch.is_tensor(observed_params):
+            observed_params = torch.from_numpy(np.ascontiguousarray(observed_params, dtype=np.float32))
+        else:
+            observed_params = observed_params.to(torch.float32)
         features, targets = self._generate_train_data(observed_params)
         num_observations = len(observed_params)
 
@@ -47,46 +62,61 @@ class BNNTrainer(Logger):
     def _construct_model(self, num_observations):
         return BNN(self.config, self.model_details, num_observations, self.frac_feas)
 
-    def _generate_train_data(self, observed_params):
-        feature_size = len(self.config.kernel_names)
-        bnn_output_size = len(self.config.kernel_names) 
-        target_size = len(self.config.kernel_names)
+    def _encode_features(self, observed_params, features):
+        """Fills the zero-initialized features tensor with the encoding of observed_params."""
         num_obs = len(observed_params)
 
-        # initialize training features and targets
-        features = torch.zeros((num_obs, feature_size))
-        targets = torch.zeros((num_obs, target_size))
-
-        # construct training features
         feature_begin = 0
         feature_sizes = self.config.feature_sizes
+        obs_indices = torch.arange(num_obs)
+        obs_ones = torch.ones(num_obs)
         for feature_index, feature_type in enumerate(self.config.feature_types):
             feature_size_idx = feature_sizes[feature_index]
-            if feature_type == 'categorical':
-                for obs_param_index, obs_param in enumerate(observed_params):
-                    features[obs_param_index, feature_begin + int(obs_param[feature_index])] += 1
-            elif feature_type == 'discrete':
-                for obs_param_index, obs_param in enumerate(observed_params):
-                    features[obs_param_index, feature_begin + int(obs_param[feature_index])] += 1
+            if feature_type in ['categorical', 'discrete']:
+                # one-hot encode all observations at once
+                option_indices = observed_params[:, feature_index].long() + feature_begin
+                features.index_put_((obs_indices, option_indices), obs_ones, accumulate=True)
             elif feature_type == 'continuous':
                 features[:, feature_begin] = observed_params[:, feature_index]
             else:
                 raise NotImplementedError
             feature_begin += feature_size_idx
+        return features
+
+    def _generate_train_data(self, observed_params):
+        feature_size = len(self.config.kernel_names)
+        num_obs = len(observed_params)
+
+        # Rows of previously seen observations never change, so if the first _cached_n observations match the
+        # ones we encoded last time, we only encode the new observations
+        if self._feat_buf is not None and num_obs >= self._cached_n and \
+                torch.equal(observed_params[:self._cached_n], self._cached_params):
+            num_cached = self._cached_n
+        else:
+            num_cached = 0
+
+        # grow the feature buffer if needed, keeping the rows we can reuse
+        if self._feat_buf is None or len(self._feat_buf) < num_obs:
+            capacity = num_obs if self._feat_buf is None else max(num_obs, 2 * len(self._feat_buf))
+            feat_buf = torch.zeros((capacity, feature_size))
+            if num_cached > 0:
+                feat_buf[:num_cached] = self._feat_buf[:num_cached]
+            self._feat_buf = feat_buf
+
+        # construct training features, zeroing only the rows we are about to encode
+        features = self._feat_buf[:num_obs]
+        new_features = features[num_cached:]
+        new_features.zero_()
+        self._encode_features(observed_params[num_cached:], new_features)
+
+        self._cached_params = observed_params.detach().clone()
+        self._cached_n = num_obs
+
         targets = features.detach().clone() ## Detach then clone or reverse?
 
         # rescale features
-        lower_rescalings = torch.empty(feature_size)
-        upper_rescalings = torch.empty(feature_size)
-        kernel_uppers, kernel_lowers = self.config.kernel_uppers, self.config.kernel_lowers
-        for kernel_index, kernel_name in enumerate(self.config.kernel_names):
-            low = kernel_lowers[kernel_index]
-            up  = kernel_uppers[kernel_index]
-            lower_rescalings[kernel_index] = low  # - 0.1 * (up - low)
-            upper_rescalings[kernel_index] = up   # + 0.1 * (up - low)
-
-        rescaled_features = (features - lower_rescalings) / (upper_rescalings - lower_rescalings)
-        rescaled_targets = (targets - lower_rescalings) / (upper_rescalings - lower_rescalings)
+        rescaled_features = (features - self.lower_rescalings) / self.rescale_range
+        rescaled_targets = (targets - self.lower_rescalings) / self.rescale_range
         return (rescaled_features, rescaled_targets)
 
 
@@ -111,6 +141,23 @@ class BNN(nn.Module):
         self.kernel_uppers = torch.tensor(config.kernel_uppers)
         self.kernel_lowers = torch.tensor(config.kernel_lowers)
         self.kernel_sizes = torch.tensor(config.kernel_sizes)
+        self.kernel_span = self.kernel_uppers - self.kernel_lowers
+
+        # all continuous kernels share the same mapping to the posterior, so we evaluate them together in forward
+        self.continuous_kernels = torch.tensor([kernel_index for kernel_index, kernel_type in enumerate(self.kernel_types)
+                                                if kernel_type == 'continuous'], dtype=torch.long)
+
+        # slices of the categorical and discrete kernels, which are evaluated one at a time in forward
+        self.categorical_kernel_slices = []
+        kernel_element_index = 0
+        while kernel_element_index < len(self.kernel_names):
+            kernel_type = self.kernel_types[kernel_element_index]
+            kernel_size = int(self.kernel_sizes[kernel_element_index])
+            if kernel_type in ['categorical', 'discrete']:
+                self.categorical_kernel_slices.append((kernel_element_index, kernel_element_index + kernel_size))
+            elif kernel_type != 'continuous':
+                raise GryffinUnknownSettingsError(f'did not understand kernel type: {kernel_type}')
+            kernel_element_index += kernel_size
 
         self.param_names = config.param_names
 
@@ -125,66 +172,50 @@ class BNN(nn.Module):
 
         self.layers = nn.Sequential(OrderedDict(layers))
         
-        self.tau_rescaling = torch.zeros((self.num_obs, self.bnn_output_size))
-        for obs_index in range(self.num_obs):
-            self.tau_rescaling[obs_index] += self.kernel_ranges
-        self.tau_rescaling = self.tau_rescaling**2
+        # shape (1, bnn_output_size), broadcast against the (num_obs, bnn_output_size) precisions
+        self.tau_rescaling = (self.kernel_ranges.to(torch.float32)**2).unsqueeze(0)
         self.gamma_concentration = nn.Parameter(torch.zeros(self.num_obs, self.bnn_output_size) + 12*(self.num_obs/self.frac_feas)**2)
         self.gamma_rate = nn.Parameter(F.softplus(torch.ones(self.num_obs, self.bnn_output_size)))
         
         self.tau_normed = td.gamma.Gamma(self.gamma_concentration, self.gamma_rate)
 
+        # temperature of the relaxed categorical posteriors, constant throughout training
+        self.post_temperature = 0.5 + (10.0 / (self.num_obs / self.frac_feas))
+
     def forward(self, x, y):
 
         x = self.layers(x)
         scale = 1.0 / torch.sqrt(td.gamma.Gamma(F.softplus(self.gamma_concentration, threshold=0.01), F.softplus(self.gamma_rate, threshold=0.01)).rsample() / self.tau_rescaling)
         
         inferences = []
-        kernel_element_index = 0
-        target_element_index = 0
-        while kernel_element_index < len(self.kernel_names):
-
-                kernel_type = self.kernel_types[kernel_element_index]
-                kernel_size = self.kernel_sizes[kernel_element_index]
 
-                feature_begin, feature_end = target_element_index, target_element_index + 1
-                kernel_begin, kernel_end   = kernel_element_index, kernel_element_index + kernel_size
+        # continuous kernels
+        if len(self.continuous_kernels) > 0:
+            cont = self.continuous_kernels
+            post_support = self.kernel_span[cont] * (1.2 * torch.sigmoid(x[:, cont]) - 0.1) + self.kernel_lowers[cont]
+            post_predict = td.normal.Normal(post_support, scale[:, cont])
+            inference = {'pred': post_predict, 'target': y[:, cont]}
+            inferences.append(inference)
 
-                post_relevant  = x[:,  kernel_begin: kernel_end]
-                
-                if kernel_type == 'continuous':
-                    target = y[:, kernel_begin: kernel_end]
-                    lowers, uppers = self.kernel_lowers[kernel_begin: kernel_end], self.kernel_uppers[kernel_begin : kernel_end]
-
-                    post_support = (uppers - lowers) * (1.2 * F.sigmoid(post_relevant) - 0.1) + lowers
-                    post_predict = td.normal.Normal(post_support,  scale[:,  kernel_begin: kernel_end])
-
-                
-                    inference = {'pred': post_predict, 'target': target}
-                    inferences.append(inference)
+        # categorical and discrete kernels
+        for kernel_begin, kernel_end in self.categorical_kernel_slices:
+            post_relevant = x[:, kernel_begin: kernel_end]
+            target = y[:, kernel_begin: kernel_end]
 
-                elif kernel_type in ['categorical', 'discrete']:
-                    target = y[:, kernel_begin: kernel_end]
+            post_support = post_relevant
 
-                    post_temperature = 0.5 + (10.0 / (self.num_obs / self.frac_feas))
-                    post_support = post_relevant
+            post_predict_relaxed = td.relaxed_categorical.RelaxedOneHotCategorical(self.post_temperature, logits=post_support)
+            post_predict = td.OneHotCategorical(probs=post_predict_relaxed.rsample())
 
-                    post_predict_relaxed = td.relaxed_categorical.RelaxedOneHotCategorical(post_temperature, logits=post_support)
-                    post_predict = td.OneHotCategorical(probs=post_predict_relaxed.rsample())
+            inference = {'pred': post_predict, 'target': target}
+            inferences.append(inference)
 
-                    inference = {'pred': post_predict, 'target': target}
-                    inferences.append(inference)
-                else:
-                    GryffinUnknownSettingsError(f'did not understand kernel type: {kernel_type}')
-                
-                kernel_element_index += kernel_size
-                target_element_index += 1
-                
         return inferences
 
     def register_numpy_graph(self, features):
         self.numpy_graph.declare_training_data(features)
 
+    @torch.no_grad()
     def _sample(self, num_draws):
 
         posterior_samples = {}
@@ -199,11 +230,11 @@ class BNN(nn.Module):
                 
                 weight_sample = weight_sample.transpose(-2, -1)
 
-                posterior_samples['weight_%d' % idx] = weight_sample.numpy()
-                posterior_samples['bias_%d' % idx] = bias_sample.numpy()
+                posterior_samples['weight_%d' % idx] = weight_sample.detach().cpu().numpy()
+                posterior_samples['bias_%d' % idx] = bias_sample.detach().cpu().numpy()
                 idx += 1
 
-        posterior_samples['gamma'] = self.tau_normed.sample(sample_shape=(num_draws, 1))
+        posterior_samples['gamma'] = self.tau_normed.sample(sample_shape=(num_draws, 1)).detach().cpu().numpy()
         post_kernels = self.numpy_graph.compute_kernels(posterior_samples, self.frac_feas)
 
         self.trace = {}
@@ -213,6 +244,7 @@ class BNN(nn.Module):
             for kernel_name, kernel_values in kernel_dict.items():
                 self.trace[key][kernel_name] = kernel_values
 
+    @torch.no_grad()
     def get_kernels(self, num_draws=None):
         
         if num_draws == None:
@@ -29,11 +29,8 @@ class NumpyGraph:
 
     def compute_kernels(self, posteriors, frac_feas):
 
-        tau_rescaling = np.zeros((self.num_obs, self.bnn_output_size))
-        kernel_ranges = self.config.kernel_ranges
-        for obs_index in range(self.num_obs):
-            tau_rescaling[obs_index] += kernel_ranges
-        tau_rescaling = tau_rescaling**2
+        # shape (1, bnn_output_size), broadcast against the (num_draws, num_obs, bnn_output_size) precisions
+        tau_rescaling = self.config.kernel_ranges[np.newaxis, :]**2
 
         # sample from BNN
         activations = [lambda x: np.maximum(x, 0), lambda x: np.maximum(x, 0), lambda x: x]
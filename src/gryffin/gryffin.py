@@ -24,6 +24,13 @@ from contextlib import nullcontext
 from typing import Callable, Union, List, Dict
 
 
+def _row_view(rows, num_dims):
+    """View each row of a 2D array as a single np.void element, so that whole rows can be compared/hashed at once"""
+    # cast to a common dtype, and add 0. to map -0. to 0. so that equal rows have the same bytes
+    rows = np.ascontiguousarray(np.reshape(rows, (-1, num_dims)), dtype=np.float64) + 0.
+    return rows.view(np.dtype((np.void, rows.dtype.itemsize * num_dims)))[:, 0]
+
+
 class Gryffin(Logger):
 
     def __init__(
@@ -248,10 +255,10 @@ class Gryffin(Logger):
                 samples[:, dominant_features] = samples[0, dominant_features]
 
             # if fully categorical, remove random samples from list of available options
-            if np.all([p['type']=='categorical' for p in self.config.parameters]):
-                for sample in samples:
-                    sample_ix = np.where(np.all(self.all_options==sample, axis=1))[0]
-                    self.all_options = np.delete(self.all_options, sample_ix, axis=0)
+            if self.config.fully_categorical:
+                num_dims = samples.shape[1]
+                is_sampled = np.isin(_row_view(self.all_options, num_dims), _row_view(samples, num_dims))
+                self.all_options = self.all_options[~is_sampled]
                 # update sample selector attribute
                 setattr(self.sample_selector, 'all_options', self.all_options)
 
@@ -286,7 +293,6 @@ class Gryffin(Logger):
                 self.log_chapter('Descriptor Refinement')
                 start = time.time()
                 #with self.console.status("Refining categories descriptors..."):
-                #import pdb; pdb.set_trace()
                 # only feasible points with known objectives
                 if len(obs_params[mask_kwn]) > 3:
                     self.descriptor_generator.generate_descriptors(obs_params[mask_kwn], obs_objs[mask_kwn])
@@ -344,7 +350,7 @@ class Gryffin(Logger):
                                                           dominant_samples=None, timings_dict=None)
                 constraining_samples = self.sample_selector.select(num_batches=self.num_batches,
                                                                    proposals=self.proposals,
-                                                                   eval_acquisition=self.acquisition.eval_acquisition,
+                                                                   eval_acquisition=self.acquisition.eval_acquisition_batch,
                                                                    sampling_param_values=dominant_strategy_value,
                                                                    obs_params=obs_params)
             else:
@@ -363,7 +369,7 @@ class Gryffin(Logger):
             self.log_chapter('Sample Selector')
             # note: provide `obs_params` as it contains the params for _all_ samples, including the unfeasible ones
             samples = self.sample_selector.select(num_batches=self.num_batches, proposals=self.proposals,
-                                                  eval_acquisition=self.acquisition.eval_acquisition,
+                                                  eval_acquisition=self.acquisition.eval_acquisition_batch,
                                                   sampling_param_values=self.sampling_param_values,
                                                   obs_params=obs_params)
 
@@ -525,13 +531,8 @@ class Gryffin(Logger):
         # collect acquisition values
         acquisition_values = {}
         for batch_index, sampling_param in enumerate(self.sampling_param_values):
-            acquisition_values_at_l = []
-            for Xi_parsed in X_parsed:
-                acq_value = self.acquisition.eval_acquisition(Xi_parsed, batch_index)
-                acquisition_values_at_l.append(acq_value)
-
             lambda_value = self.sampling_strategies[batch_index]
-            acquisition_values[lambda_value] = np.array(acquisition_values_at_l)
+            acquisition_values[lambda_value] = self.acquisition.eval_acquisition_batch(X_parsed, batch_index)
 
         return acquisition_values
 
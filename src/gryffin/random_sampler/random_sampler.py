@@ -8,21 +8,33 @@ from gryffin.utilities import Logger
 from gryffin.utilities import GryffinUnknownSettingsError, GryffinComputeError
 from gryffin.observation_processor import param_vector_to_dict
 
+# integer codes of the parameter types, used in the array-based description of the parameters
+CONTINUOUS, CATEGORICAL, DISCRETE = 0, 1, 2
+PARAM_TYPE_CODES = {'continuous': CONTINUOUS, 'categorical': CATEGORICAL, 'discrete': DISCRETE}
+
 
 class RandomSampler(Logger):
 
-    def __init__(self, config, constraints=None):
+    def __init__(self, config, constraints=None, seed=None):
         """
         known_constraints : list of callable
             List of constraint functions. Each is a function that takes a parameter dict, e.g.
             {'x0':0.1, 'x1':10, 'x2':'A'} and returns a bool indicating
             whether it is in the feasible region or not.
+        seed : int or None
+            seed for the random number generator of this sampler. If None, the generator is seeded from the
+            global numpy random state, so that results are still reproducible when ``random_seed`` is set.
         """
 
         # register attributes
         self.config = config
         self.reject_tol = self.config.get('reject_tol')
 
+        # random number generator used for all draws
+        if seed is None:
+            seed = np.random.randint(np.iinfo(np.int32).max)
+        self._rng = np.random.default_rng(seed)
+
         # if constraints not None, and not a list, put into a list
         if constraints is not None and isinstance(constraints, list) is False:
             self.constraints = [constraints]
@@ -33,6 +45,32 @@ class RandomSampler(Logger):
         verbosity = self.config.get('verbosity')
         Logger.__init__(self, 'RandomSampler', verbosity)
 
+        # describe the parameters as contiguous arrays of types, bounds and number of options, so that the
+        # sampling methods do not need to look up the parameter dicts
+        parameters = list(self.config.parameters)
+        self._num_params = len(parameters)
+        self._types = np.array([PARAM_TYPE_CODES.get(param['type'], -1) for param in parameters], dtype=np.int8)
+        for param in parameters:
+            if param['type'] not in PARAM_TYPE_CODES:
+                raise GryffinUnknownSettingsError(f'cannot understand parameter type "{param["type"]}"')
+        self._lows = np.array([param['specifics'].get('low', 0.) for param in parameters], dtype=np.float64)
+        self._highs = np.array([param['specifics'].get('high', 0.) for param in parameters], dtype=np.float64)
+        self._num_options = np.array([len(param['specifics'].get('options', [])) for param in parameters],
+                                     dtype=np.int64)
+
+        # indices and bounds of the parameters of each type, so that all parameters of the same type can be
+        # drawn at once
+        self._cont_idx = np.flatnonzero(self._types == CONTINUOUS)
+        self._cont_low = self._lows[self._cont_idx]
+        self._cont_high = self._highs[self._cont_idx]
+        self._cont_range = self._cont_high - self._cont_low
+        self._disc_idx = np.flatnonzero(self._types == DISCRETE)
+        self._disc_low = self._lows[self._disc_idx]
+        self._disc_high = self._highs[self._disc_idx]
+        self._disc_range = self._disc_high - self._disc_low
+        self._cat_idx = np.flatnonzero(self._types == CATEGORICAL)
+        self._cat_sizes = self._num_options[self._cat_idx]
+
     def draw(self, num=1):
         # if no constraints, we do not need to do any "rejection sampling"
         if self.constraints is None:
@@ -51,73 +89,78 @@ class RandomSampler(Logger):
         return perturbed_samples
 
     def _fast_draw(self, num=1):
-        samples = []
-        for param_index, param_settings in enumerate(self.config.parameters):
-            param_type = param_settings['type']
-            specs = param_settings['specifics']
-            param_samples = self._draw_single_parameter(num=num, param_type=param_type, specs=specs)
-            samples.append(param_samples)
-        samples = np.concatenate(samples, axis=1)
+        samples = np.empty((num, self._num_params), dtype=np.float32)
+
+        # draw all parameters of the same type in one go
+        if len(self._cont_idx) > 0:
+            samples[:, self._cont_idx] = self._draw_continuous(low=self._cont_low, high=self._cont_high,
+                                                               size=(num, len(self._cont_idx)))
+        if len(self._disc_idx) > 0:
+            samples[:, self._disc_idx] = self._draw_discrete(low=self._disc_low, high=self._disc_high,
+                                                             size=(num, len(self._disc_idx)))
+        if len(self._cat_idx) > 0:
+            # categories are drawn with replacement only if we need more samples than options
+            replace = self._cat_sizes < num
+            if np.any(replace):
+                samples[:, self._cat_idx[replace]] = self._rng.integers(low=0, high=self._cat_sizes[replace],
+                                                                        size=(num, np.sum(replace)))
+            for param_index, num_options in zip(self._cat_idx[~replace], self._cat_sizes[~replace]):
+                samples[:, param_index] = self._draw_categorical(num_options=num_options, size=(num, 1))[:, 0]
         return samples
 
     def _slow_draw(self, num=1):
         samples = []
         counter = 0
+        max_draws = self.reject_tol * num
+        batch_size = max(num * 4, 32)
 
-        # keep trying random samples until we get num samples
+        # keep drawing batches of random samples until we get num feasible samples
         while len(samples) < num:
-            sample = []  # we store the random sample used by Gryffin here
-
-            # iterate over each variable and draw at random
-            for param_index, param_settings in enumerate(self.config.parameters):
-                specs = param_settings['specifics']
-                param_type = param_settings['type']
-                param_sample = self._draw_single_parameter(num=1, param_type=param_type, specs=specs)[0]
-                sample.append(param_sample[0])
-
-            # evaluate whether the sample violates the known constraints
-            param = param_vector_to_dict(param_vector=sample, param_names=self.config.param_names,
-                                         param_options=self.config.param_options, param_types=self.config.param_types)
-
-            feasible = [constr(param) for constr in self.constraints]
-            if all(feasible) is True:
-                samples.append(sample)
-
-            counter += 1
-            if counter % num == 0:
-                self.log(f'drawn {counter} random samples', 'DEBUG')
-            if counter > self.reject_tol * num:
+            if counter >= max_draws:
                 p = 100. / self.reject_tol
                 raise GryffinComputeError(f"the feasible region seems to be less than {p}% of the optimization "
                                           f"domain. Consider redefining the problem or increasing 'reject_tol'.")
 
-        samples = np.array(samples)
+            candidates = self._fast_draw(num=batch_size)
+            # evaluate whether the samples violate the known constraints
+            feasible = np.fromiter((self._is_feasible(candidate) for candidate in candidates), dtype=bool,
+                                   count=batch_size)
+            samples.extend(candidates[feasible])
+
+            counter += batch_size
+            self.log(f'drawn {counter} random samples', 'DEBUG')
+
+            # draw enough samples in the next batch to reach num, given the fraction of feasible samples so far
+            feasible_fraction = max(np.mean(feasible), 1e-3)
+            batch_size = max(batch_size, int((num - len(samples)) / feasible_fraction) + 1)
+            batch_size = int(min(batch_size, max(max_draws - counter, 1)))
+
+        samples = np.array(samples[:num])
         return samples
 
-    def _draw_single_parameter(self, num, param_type, specs):
-        if param_type == 'continuous':
-            sampled_values = self._draw_continuous(low=specs['low'], high=specs['high'], size=(num, 1))
-        elif param_type == 'categorical':
-            sampled_values = self._draw_categorical(num_options=len(specs['options']), size=(num, 1))
-        elif param_type == 'discrete':
-            sampled_values = self._draw_discrete(low=specs['low'], high=specs['high'], size=(num, 1))
-        else:
-            GryffinUnknownSettingsError(f'cannot understand parameter type "{param_type}"')
-        return sampled_values
+    def _is_feasible(self, sample):
+        param = param_vector_to_dict(param_vector=sample, param_names=self.config.param_names,
+                                     param_options=self.config.param_options, param_types=self.config.param_types)
+        return all([constr(param) for constr in self.constraints])
 
     def _fast_perturb(self, ref_sample, num=1, scale=0.05):
         """Perturbs a reference sample by adding random uniform noise around it"""
-        perturbed_samples = []
-        for param_index, param_settings in enumerate(self.config.parameters):
-            param_type = param_settings['type']
-            specs = param_settings['specifics']
-            ref_value = ref_sample[param_index]
-            perturbed_param_samples = self._perturb_single_parameter(ref_value=ref_value, num=num,
-                                                                     param_type=param_type,
-                                                                     specs=specs, scale=scale)
-            perturbed_samples.append(perturbed_param_samples)
-
-        perturbed_samples = np.concatenate(perturbed_samples, axis=1)
+        # categorical parameters are not perturbed, i.e. they keep the value of ref_sample
+        ref_sample = np.asarray(ref_sample, dtype=np.float32)
+        perturbed_samples = np.tile(ref_sample, (num, 1))
+
+        # add +/- 5% perturbation to all continuous and discrete parameters at once, making sure we do not
+        # cross optimization boundaries
+        if len(self._cont_idx) > 0:
+            noise = self._draw_continuous(-scale, scale, (num, len(self._cont_idx))) * self._cont_range
+            perturbed_samples[:, self._cont_idx] = np.clip(ref_sample[self._cont_idx] + noise,
+                                                           self._cont_low, self._cont_high)
+        if len(self._disc_idx) > 0:
+            # if discrete, we round to nearest integer
+            noise = np.around(self._draw_continuous(-scale, scale, (num, len(self._disc_idx))) * self._disc_range,
+                              decimals=0)
+            perturbed_samples[:, self._disc_idx] = np.clip(ref_sample[self._disc_idx] + noise,
+                                                           self._disc_low, self._disc_high)
         return perturbed_samples
 
     def _slow_perturb(self, ref_sample, num=1, scale=0.05):
@@ -131,12 +174,10 @@ class RandomSampler(Logger):
             perturbed_sample = []  # we store the samples here
 
             # iterate over each variable and perturb ref_sample
-            for param_index, param_settings in enumerate(self.config.parameters):
-                specs = param_settings['specifics']
-                param_type = param_settings['type']
+            for param_index in range(self._num_params):
                 ref_value = ref_sample[param_index]
-                perturbed_param = self._perturb_single_parameter(ref_value=ref_value, num=1, param_type=param_type,
-                                                                 specs=specs, scale=new_scale,
+                perturbed_param = self._perturb_single_parameter(ref_value=ref_value, num=1, param_index=param_index,
+                                                                 scale=new_scale,
                                                                  perturb_categorical=perturb_categorical)[0]
                 perturbed_sample.append(perturbed_param[0])
 
@@ -165,43 +206,41 @@ class RandomSampler(Logger):
         perturbed_samples = np.array(perturbed_samples)
         return perturbed_samples
 
-    def _perturb_single_parameter(self, ref_value, num, param_type, specs, scale, perturb_categorical=False):
-        if param_type in ['continuous', 'discrete']:
+    def _perturb_single_parameter(self, ref_value, num, param_index, scale, perturb_categorical=False):
+        param_type = self._types[param_index]
+        low, high = self._lows[param_index], self._highs[param_index]
+        if param_type == CONTINUOUS or param_type == DISCRETE:
             # draw uniform within unit range
             sampled_values = self._draw_continuous(-scale, scale, (num, 1))
             # scale to actual range
-            sampled_values *= specs['high'] - specs['low']
+            sampled_values *= high - low
             # if discrete, we round to nearest integer
-            if param_type == 'discrete':
+            if param_type == DISCRETE:
                 sampled_values = np.around(sampled_values, decimals=0)
             # add +/- 5% perturbation to sample
             perturbed_sample = ref_value + sampled_values
             # make sure we do not cross optimization boundaries
-            perturbed_sample = np.where(perturbed_sample < specs['low'], specs['low'], perturbed_sample)
-            perturbed_sample = np.where(perturbed_sample > specs['high'], specs['high'], perturbed_sample)
-        elif param_type == 'categorical':
+            perturbed_sample = np.clip(perturbed_sample, low, high)
+        elif param_type == CATEGORICAL:
             # i.e. do not perturb
             if perturb_categorical is False:
                 perturbed_sample = ref_value * np.ones((num, 1)).astype(np.float32)
             # i.e. random draw
             else:
-                perturbed_sample = self._draw_categorical(num_options=len(specs['options']), size=(num, 1))
+                perturbed_sample = self._draw_categorical(num_options=self._num_options[param_index], size=(num, 1))
         else:
             GryffinUnknownSettingsError('did not understand settings')
         return perturbed_sample
 
-    @staticmethod
-    def _draw_categorical(num_options, size):
+    def _draw_categorical(self, num_options, size):
         if size[0] > num_options:
             replace = True
         else:
             replace = False
-        return np.random.choice(num_options, size=size, replace=replace).astype(np.float32)
+        return self._rng.choice(num_options, size=size, replace=replace).astype(np.float32)
 
-    @staticmethod
-    def _draw_continuous(low, high, size):
-        return np.random.uniform(low=low, high=high, size=size).astype(np.float32)
+    def _draw_continuous(self, low, high, size):
+        return self._rng.uniform(low=low, high=high, size=size).astype(np.float32)
 
-    @staticmethod
-    def _draw_discrete(low, high, size):
-        return np.random.randint(low=0, high=high - low + 1, size=size).astype(np.float32)
+    def _draw_discrete(self, low, high, size):
+        return self._rng.integers(low=0, high=high - low + 1, size=size).astype(np.float32)
@@ -6,10 +6,72 @@ import numpy as np
 import time
 from contextlib import nullcontext
 import multiprocessing
-from multiprocessing import Manager, Process
 
 from gryffin.utilities import Logger, parse_time
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional: without it, the diversity penalties are computed with numpy broadcasting
+    njit = None
+
+
+def _log_div_crits_numpy(min_distances, char_dist):
+    """Log of the diversity rewards of proposals, min(1, mean(exp(2 * (d - char_dist)))), given their per-dimension
+    min distances in normalized units d, shape (num_proposals, num_dims), and the characteristic distance char_dist.
+    The mean is computed as a log-mean-exp, so that small rewards do not underflow"""
+    exp_args = 2. * (min_distances - char_dist)
+    max_exp_args = np.amax(exp_args, axis=1)
+    log_means = max_exp_args + np.log(np.mean(np.exp(exp_args - max_exp_args[:, None]), axis=1))
+    return np.minimum(0., log_means)
+
+
+def _log_div_crits_loop(min_distances, char_dist):
+    """Same as _log_div_crits_numpy, but fuses exp, mean, log and min in one pass over the proposals without
+    temporary arrays. Meant to be compiled with numba. This is a serial loop: numba's threading layers are not
+    fork-safe, and the selector may run in the parent of forked pool workers"""
+    num_proposals, num_dims = min_distances.shape
+    # same dtype as the numpy version returns, so that the rewards do not depend on whether numba is installed
+    log_div_crits = np.empty(num_proposals, dtype=min_distances.dtype)
+    for proposal_idx in range(num_proposals):
+        max_exp_arg = 2. * (min_distances[proposal_idx, 0] - char_dist)
+        for dim in range(1, num_dims):
+            max_exp_arg = max(max_exp_arg, 2. * (min_distances[proposal_idx, dim] - char_dist))
+        reward = 0.
+        for dim in range(num_dims):
+            reward += np.exp(2. * (min_distances[proposal_idx, dim] - char_dist) - max_exp_arg)
+        log_div_crits[proposal_idx] = min(0., max_exp_arg + np.log(reward / num_dims))
+    return log_div_crits
+
+
+if njit is not None:
+    _log_div_crits = njit(cache=True)(_log_div_crits_loop)
+else:
+    _log_div_crits = _log_div_crits_numpy
+
+
+# the acquisition cannot be pickled (it holds the BNN and the loggers), so it is handed to the pool
+# workers when they are started and kept here for the lifetime of each worker. The proposals are handed over
+# in the same way, so that they are inherited by the forked workers rather than pickled with every task, and so is
+# the shared memory buffer the workers write their results into
+_worker_eval_acquisition = None
+_worker_proposals = None
+_worker_log_rewards = None
+
+
+def _init_worker(eval_acquisition, proposals, log_rewards_buffer, log_rewards_shape):
+    global _worker_eval_acquisition, _worker_proposals, _worker_log_rewards
+    _worker_eval_acquisition = eval_acquisition
+    _worker_proposals = proposals
+    _worker_log_rewards = np.frombuffer(log_rewards_buffer).reshape(log_rewards_shape)
+
+
+def _compute_log_rewards_worker(sampling_param_idx, start, stop):
+    # evaluate the proposals of a single sampling strategy with indices in [start, stop), and write the results
+    # straight into the shared output array
+    samples = _worker_proposals[sampling_param_idx, start:stop]
+    _worker_log_rewards[sampling_param_idx, start:stop] = -_worker_eval_acquisition(samples, sampling_param_idx)
+
 
 class SampleSelector(Logger):
 
@@ -52,70 +114,76 @@ class SampleSelector(Logger):
 
 
     @staticmethod
-    def compute_exp_objs(
+    def compute_log_rewards(
         proposals,
         eval_acquisition,
         sampling_param_idx,
-        return_index=0,
-        return_dict=None,
         ):
         # batch_index is the index of the sampling_param_values used
         samples = proposals[sampling_param_idx]
-        exp_objs = np.empty(len(samples))
-
-        for sample_index, sample in enumerate(samples):
-            acq = eval_acquisition(sample, sampling_param_idx)  # this is a method of the Acquisition instance
-            exp_objs[sample_index] = np.exp(-acq)
-
-        if return_dict.__class__.__name__ == 'DictProxy':
-            return_dict[return_index] = exp_objs
-
-        return exp_objs
-
-    def _compute_exp_objs(self, proposals, eval_acquisition, sampling_param_values):
+        # evaluate all samples at once, this is a method of the Acquisition instance
+        acqs = eval_acquisition(samples, sampling_param_idx)
+        # the rewards used to select samples are np.exp(-acq), we keep their log
+        log_rewards = -acqs
+        return log_rewards
+
+    def _get_parallel_tasks(self, num_sampling_strategies, num_proposals):
+        """split the proposals of each sampling strategy into approx equal chunks based on how many CPUs we're using,
+        so that all chunks of all strategies can be dispatched as a single batch of (sampling_param_idx, start, stop)
+        tasks"""
+        num_splits = self.num_cpus
+        split_bounds = np.linspace(0, num_proposals, num_splits + 1).astype(int)
+        tasks = [(sampling_param_idx, split_bounds[split_idx], split_bounds[split_idx + 1])
+                 for sampling_param_idx in range(num_sampling_strategies)
+                 for split_idx in range(num_splits)]
+        return tasks
+
+    def _compute_log_rewards(self, proposals, eval_acquisition, sampling_param_values):
+
+        # preallocate the output, each sampling strategy fills its own row
+        log_rewards_shape = (len(sampling_param_values), proposals.shape[1])  # (num_sampling_strategies, num_proposals)
+
+        # the workers are given the acquisition at start up, so we need a new pool for every acquisition: a pool kept
+        # across select calls would evaluate the acquisition of a previous recommendation.
+        # We create it once for all sampling strategies
+        if self.num_cpus > 1:
+            # the output lives in shared memory, so that the workers can fill it without sending results back
+            log_rewards_buffer = multiprocessing.RawArray('d', int(np.prod(log_rewards_shape)))
+            log_rewards = np.frombuffer(log_rewards_buffer).reshape(log_rewards_shape)
+            pool = multiprocessing.Pool(self.num_cpus, initializer=_init_worker,
+                                        initargs=(eval_acquisition, proposals,
+                                                  log_rewards_buffer, log_rewards_shape))
+        else:
+            log_rewards = np.empty(log_rewards_shape)
+            pool = None
 
-        exp_objs = []
-        # -----------------------------------------
-        # compute exponential of acquisition values
-        # -----------------------------------------
+        # ---------------------------------------------------------------
+        # compute log rewards, i.e. the negative of the acquisition values
+        # ---------------------------------------------------------------
         # TODO: this is slightly redundant as we have computed acquisition values already in Acquisition
-        for sampling_param_idx, sampling_param in enumerate(sampling_param_values):
+        try:
             # -------------------
             # parallel processing
             # -------------------
-            if self.num_cpus > 1:
-                return_dict = Manager().dict()
-                # split proposals into approx equal chunks based on how many CPUs we're using
-                proposals_splits = np.array_split(proposals, self.num_cpus, axis=1)
-                # parallelize over splits
-                # -----------------------
-                processes = []
-                for return_idx, proposals_split in enumerate(proposals_splits):
-                    process = Process(target=self.compute_exp_objs, args=(proposals_split, eval_acquisition,
-                                                                          sampling_param_idx,
-                                                                          return_idx, return_dict))
-                    processes.append(process)
-                    process.start()
-                # wait until all processes finished
-                for process in processes:
-                    process.join()
-                # sort results in return_dict to create batch_exp_objs list with correct sample order
-                batch_exp_objs = []
-                for idx in range(len(proposals_splits)):
-                    batch_exp_objs.extend(return_dict[idx])
+            if pool is not None:
+                # tasks only carry the index range of their chunk, as the workers already hold the proposals
+                tasks = self._get_parallel_tasks(*log_rewards_shape)
+                # the workers write their results into log_rewards, so we only wait for all tasks to be done
+                pool.starmap(_compute_log_rewards_worker, tasks)
             # ---------------------
             # sequential processing
             # ---------------------
             else:
-                batch_exp_objs = self.compute_exp_objs(proposals=proposals, eval_acquisition=eval_acquisition,
-                                                       sampling_param_idx=sampling_param_idx, return_index=0,
-                                                       return_dict=None)
-            # append the proposed samples for this sampling strategy to the global list of samples
-            exp_objs.append(batch_exp_objs)
-        # cast to np.array
-        exp_objs = np.array(exp_objs)
+                for sampling_param_idx, sampling_param in enumerate(sampling_param_values):
+                    log_rewards[sampling_param_idx] = self.compute_log_rewards(proposals=proposals,
+                                                                               eval_acquisition=eval_acquisition,
+                                                                               sampling_param_idx=sampling_param_idx)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-        return exp_objs
+        return log_rewards
 
     def select(
         self,
@@ -132,7 +200,9 @@ class SampleSelector(Logger):
                 argumnet in the configuration)
             proposals (np.nadarray): array of proposals from the acquisition function, shape
                 is (num_sampling_strategies, num_samples, num_dims)
-            eval_acquisition (obj): instance of acquisition function
+            eval_acquisition (callable): batched acquisition function, takes an array of samples with shape
+                (num_samples, num_dims) and the index of the sampling parameter, and returns an array of
+                acquisition values with shape (num_samples,)
             sampling_param_values (np.ndarray): array of sampling parameter values
             obs_params (np.ndarray): array of parameter points which have already been measured,
                 shape is (num_obs, num_dims)
@@ -162,15 +232,22 @@ class SampleSelector(Logger):
                 argumnet in the configuration)
             proposals (np.nadarray): array of proposals from the acquisition function, shape
                 is (num_sampling_strategies, num_samples, num_dims)
-            eval_acquisition (obj): instance of acquisition function
+            eval_acquisition (callable): batched acquisition function, takes an array of samples with shape
+                (num_samples, num_dims) and the index of the sampling parameter, and returns an array of
+                acquisition values with shape (num_samples,)
             sampling_param_values (np.ndarray): array of sampling parameter values
             obs_params (np.ndarray): array of parameter points which have already been measured,
                 shape is (num_obs, num_dims)
 
         """
 
-        # exponential of negative acquisition function values, i.e. np.exp(-acq)
-        exp_objs = self._compute_exp_objs(proposals, eval_acquisition, sampling_param_values)  # (num_sampling_strategies, num_propsals)
+        # log of the rewards np.exp(-acq), i.e. negative acquisition function values. Working in log-domain means
+        # that rewards cannot underflow to zero, and we do not need to exponentiate them
+        log_rewards = self._compute_log_rewards(proposals, eval_acquisition, sampling_param_values)  # (num_sampling_strategies, num_propsals)
+
+        # label identical proposals with the same id, so that duplicates of a selected sample can be looked up directly
+        if self.problem_type in ['fully_discrete', 'mixed_discrete', 'fully_categorical']:
+            duplicate_ids = self.get_duplicate_ids(proposals)  # (num_sampling_strategies, num_propsals)
 
         #-------------------------------
         # compute prior recommendations
@@ -180,19 +257,21 @@ class SampleSelector(Logger):
         obs_params_norm = (obs_params - self.config.param_lowers) / (self.config.param_uppers - self.config.param_lowers)
         proposals_norm = (proposals - self.config.param_lowers) / (self.config.param_uppers - self.config.param_lowers)
 
-        # here we set to zero the reward if proposals are too close to previous observed params
+        # here we set to zero the reward (-inf log reward) if proposals are too close to previous observed params
+        obs_sq_norms = np.sum(obs_params_norm**2, axis=1)  # (num_obs,)
         for sampling_param_idx in range(len(sampling_param_values)):
-            batch_proposals = proposals_norm[sampling_param_idx, : exp_objs.shape[1]]  # (num_proposals, num_dims)
-
-            # compute distance to each obs_param
-            distances = [np.sum((obs_params_norm - batch_proposal)**2, axis=1) for batch_proposal in batch_proposals]
-            distances = np.array(distances) # (num_propsals, num_obs)
-            # take min distance across previous observations
-            min_distances = np.amin(distances, axis=1)   # (num_propsals,)
+            batch_proposals = proposals_norm[sampling_param_idx, : log_rewards.shape[1]]  # (num_proposals, num_dims)
+
+            # compute squared distance of each proposal to each obs_param as |a|^2 + |b|^2 - 2ab, so that no
+            # (num_proposals, num_obs, num_dims) array is needed, and take the min across observations.
+            # Rounding can make the distance of identical points slightly negative, so we clip at zero
+            distances = np.sum(batch_proposals**2, axis=1)[:, None] + obs_sq_norms[None, :] \
+                - 2. * np.dot(batch_proposals, obs_params_norm.T)  # (num_propsals, num_obs)
+            min_distances = np.maximum(np.amin(distances, axis=1), 0.)   # (num_propsals,)
             # get indices for proposals that are basically the same as previous samples
             ident_indices = np.where(min_distances < 1e-8)[0]
             # set reward to zero for these samples since we do not want to select them
-            exp_objs[sampling_param_idx, ident_indices] = 0.
+            log_rewards[sampling_param_idx, ident_indices] = -np.inf
 
 
         #-----------------
@@ -201,86 +280,131 @@ class SampleSelector(Logger):
 
         if self.problem_type is not 'fully_categorical':
 
+            # the diversity penalties are computed with the normalized params used above, such that the range of
+            # each non-categorical dimension is 1 and the characteristic distance is the same for all dimensions
             num_obs = len(obs_params)
-            feature_ranges = self.config.feature_ranges[self.non_cat_param_idx]
-            char_dists = feature_ranges / float(num_obs)**self.dist_param
+            char_dist = 1. / float(num_obs)**self.dist_param
 
             # here we add a penalty term that depends on the minimum distance between the proposals and
-            # previously sampled or measured
+            # previously sampled or measured. Penalties are only used to rank proposals, so single precision is
+            # enough and halves the memory traffic; the selected samples themselves are taken from proposals
+            obs_params_non_cat = obs_params_norm[:, self.non_cat_param_idx].astype(np.float32)  # (num_obs, num_non_cat_dims)
+            proposals_non_cat = proposals_norm[:, :, self.non_cat_param_idx].astype(np.float32)  # (num_sampling_strategies, num_proposals, num_non_cat_dims)
+            # min distances, per dimension, of all proposals to previous observations. These are then kept up to
+            # date with the newly selected samples, so we do not recompute distances to all selected samples.
+            # The min is accumulated one observation at a time, so memory stays at the size of proposals_non_cat
+            min_distances = np.full(proposals_non_cat.shape, np.inf, dtype=np.float32)  # (num_sampling_strategies, num_proposals, num_non_cat_dims)
+            distances = np.empty_like(min_distances)
+            for obs_param_non_cat in obs_params_non_cat:
+                np.subtract(proposals_non_cat, obs_param_non_cat, out=distances)
+                np.abs(distances, out=distances)
+                np.minimum(min_distances, distances, out=min_distances)
             selected_samples = []
             for batch_idx in range(num_batches):
                 for sampling_param_idx in range(len(sampling_param_values)):
 
-                    batch_proposals = proposals[sampling_param_idx, :, :]  # (num_proposals, num_dims)
-                    batch_proposals = batch_proposals[:, self.non_cat_param_idx] # (num_proposals, num_non_cat_dims)
+                    # min distances of batch proposals to previous observations or other proposed samples
+                    min_distance = min_distances[sampling_param_idx]  # (num_proposals, num_non_cat_dims)
 
                     # compute diversity punishments
-                    num_proposals_in_batch = exp_objs.shape[1]
-                    div_crits = np.ones(num_proposals_in_batch)  # (num_proposals,)
-
-                    # iterate over batch proposals and compute min distances to previous observations
-                    # or other proposed samples
-                    for proposal_idx, proposal in enumerate(batch_proposals):
-                        # compute min distance to observed samples
-                        obs_min_distance = np.amin([np.abs(proposal - x[self.non_cat_param_idx]) for x in obs_params], axis=0)
-                        # if we already chose a new sample, compute also min distance to newly chosen samples
-                        if len(selected_samples) > 0:
-                            min_distance = np.amin([np.abs(proposal - x[self.non_cat_param_idx]) for x in selected_samples], axis=0)
-                            min_distance = np.minimum(min_distance, obs_min_distance)
-                        else:
-                            min_distance = obs_min_distance
-
-                        # compute distance reward
-                        div_crits[proposal_idx] = np.minimum(1., np.mean(np.exp(2. * (min_distance - char_dists) / feature_ranges)))
+                    log_div_crits = _log_div_crits(min_distance, char_dist)  # (num_proposals,)
 
                     # reweight computed based on acquisition with rewards based on distance
-                    reweighted_rewards = exp_objs[sampling_param_idx] * div_crits  # (num_proposals,)
+                    reweighted_rewards = log_rewards[sampling_param_idx] + log_div_crits  # (num_proposals,)
                     # get index of proposal with largest rewards
                     largest_reward_index = np.argmax(reweighted_rewards)
 
-                    # select the sample from batch_proposals
-                    # not from batch_proposals_norm that was used only for computing penalties
+                    # select the sample from proposals
+                    # not from proposals_norm that was used only for computing penalties
                     new_sample = proposals[sampling_param_idx, largest_reward_index]
                     selected_samples.append(new_sample)
+                    # update min distances of all proposals with the newly selected sample, reusing the
+                    # distances buffer so that no new array is allocated per selected sample
+                    new_sample_non_cat = proposals_non_cat[sampling_param_idx, largest_reward_index]
+                    np.subtract(proposals_non_cat, new_sample_non_cat, out=distances)
+                    np.abs(distances, out=distances)
+                    np.minimum(min_distances, distances, out=min_distances)
 
                     # update the reward of the selected sample
-                    exp_objs[sampling_param_idx, largest_reward_index] = 0.
+                    log_rewards[sampling_param_idx, largest_reward_index] = -np.inf
 
                     if self.problem_type in ['fully_discrete', 'mixed_discrete']:
                         # take care of duplicate parameters for other sampling strategies
-                        exp_objs = self.duplicate_manager(new_sample, proposals, exp_objs)
+                        log_rewards = self.duplicate_manager(duplicate_ids[sampling_param_idx, largest_reward_index],
+                                                             duplicate_ids, log_rewards)
 
         else:
 
+            # with a single sampling strategy, the rewards only change because selected samples and their duplicates
+            # are excluded, so the samples picked one at a time are the num_batches best distinct proposals
+            if len(sampling_param_values) == 1:
+                top_indices = self._top_distinct_indices(log_rewards[0], duplicate_ids[0], num_batches)
+                if top_indices is not None:
+                    return proposals[0, top_indices]
+
             selected_samples = []
             for batch_idx in range(num_batches):
                 for sampling_param_idx in range(len(sampling_param_values)):
                     batch_proposals = proposals[sampling_param_idx, :, :] # (num_propsals, num_dims)
-                    rewards = exp_objs[sampling_param_idx]
+                    rewards = log_rewards[sampling_param_idx]
                     largest_reward_index = np.argmax(rewards)
 
                     new_sample = batch_proposals[largest_reward_index]
                     selected_samples.append(new_sample)
 
                     # take care fo duplicated parameters for other sampling strategies
-                    exp_objs = self.duplicate_manager(new_sample, proposals, exp_objs)
+                    log_rewards = self.duplicate_manager(duplicate_ids[sampling_param_idx, largest_reward_index],
+                                                         duplicate_ids, log_rewards)
 
 
         return np.array(selected_samples)
 
 
-    def duplicate_manager(self, new_sample, proposals, exp_objs):
-        """ sets exp_obj to 0.0 for all proposals which have already been
+    @staticmethod
+    def _top_distinct_indices(log_rewards, duplicate_ids, num_samples):
+        """ returns the indices of the num_samples proposals with largest log rewards, taking only the first of
+        each set of duplicates, in the order in which np.argmax would pick them. Returns None if there are fewer than
+        num_samples distinct proposals with finite rewards
+
+        Args:
+            log_rewards (np.ndarray): log rewards of the proposals, shape is (num_samples,)
+            duplicate_ids (np.ndarray): ids of the proposals, as returned by get_duplicate_ids
+            num_samples (int): number of proposals to select
+        """
+        # stable sort, so that ties are broken by the lowest index like np.argmax
+        order = np.argsort(-log_rewards, kind='stable')
+        # keep only the best ranked proposal of each set of duplicates
+        _, first_indices = np.unique(duplicate_ids[order], return_index=True)
+        candidates = order[np.sort(first_indices)]
+        candidates = candidates[np.isfinite(log_rewards[candidates])]
+        if len(candidates) < num_samples:
+            return None
+        return candidates[:num_samples]
+
+    @staticmethod
+    def get_duplicate_ids(proposals):
+        """ assigns the same integer id to all identical proposals
+
+        Args:
+            proposals (np.ndarray): array of proposals, shape is (num_sampling_strategies, num_samples, num_dims)
+
+        Returns:
+            duplicate_ids (np.ndarray): array of ids with shape (num_sampling_strategies, num_samples)
+        """
+        num_sampling_strategies, num_samples, num_dims = proposals.shape
+        _, duplicate_ids = np.unique(proposals.reshape(-1, num_dims), axis=0, return_inverse=True)
+        return duplicate_ids.reshape(num_sampling_strategies, num_samples)
+
+    def duplicate_manager(self, duplicate_id, duplicate_ids, log_rewards):
+        """ sets the log reward to -inf for all proposals which have already been
         either measured or selected
 
         Args:
-            new_sample ():
-            proposals (np.ndarray):
-            exp_objs (np.ndarray):
+            duplicate_id (int): id of the new sample, as returned by get_duplicate_ids
+            duplicate_ids (np.ndarray): ids of all proposals, as returned by get_duplicate_ids
+            log_rewards (np.ndarray):
         """
-        # get the indices for the duplicates
-        samp_idxs, prop_idxs = np.where(np.all(proposals == new_sample, axis=2))
-        # replace duplicated samples exp objs with 0.0
-        exp_objs[samp_idxs, prop_idxs] = 0.0
+        # replace duplicated samples log rewards with -inf
+        log_rewards[duplicate_ids == duplicate_id] = -np.inf
 
-        return exp_objs
+        return log_rewards
@@ -180,6 +180,9 @@ class ConfigParser(Logger):
             self.features.add_attr(key, feature_configs[key])
             self.kernels.add_attr(key, kernel_configs[key])
 
+        # the parameter types do not change after parsing, so we check once whether the space is fully categorical
+        self._fully_categorical = all(param_type == 'categorical' for param_type in param_configs['type'])
+
     def _parse_objectives(self, provided_settings):
         """
         Note that we expect objectives to be provided in order or priority/hierarchy
@@ -223,6 +226,10 @@ class ConfigParser(Logger):
         is_constrained = np.any(self.parameters.process_constrained)
         return is_constrained
 
+    @property
+    def fully_categorical(self):
+        return self._fully_categorical
+
     @property
     def param_names(self):
         return self.parameters.name
@@ -12,21 +12,18 @@ def compute_constrained_cartesian(known_constraints, config):
         options.append(np.arange(len(param['specifics']['options'])))
     # compute cartesian product space
     options = np.array(list(itertools.product(*options)))
-    # apply constraint(s)
+    # apply constraint(s): build a mask of valid options and select them with a single copy
     if known_constraints is not None:
-        constrained_options = []
-        for option in options:
+        is_valid = np.zeros(len(options), dtype=bool)
+        for option_idx, option in enumerate(options):
             # map to param dict
             p_dict = {p['name']: p['specifics']['options'][int(o_ix)] for p, o_ix in zip(config.parameters, option)}
-            is_valid = known_constraints(p_dict)
-            if is_valid:
-                constrained_options.append(option)
-            else:
-                pass
+            is_valid[option_idx] = known_constraints(p_dict)
+        constrained_options = options[is_valid]
     else:
         constrained_options = options
 
-    return list(constrained_options)
+    return constrained_options
 
 def estimate_feas_fraction(known_constraints, config, resolution=100):
     ''' Produces an estimate of the fraction of the domain which
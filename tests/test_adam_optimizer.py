@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+import pytest
+import numpy as np
+
+from gryffin.acquisition.gradient_optimizer.adam_optimizer import AdamOptimizer, _adam_step
+
+
+def test_adam_step_compiled_matches_numpy():
+	py_func = getattr(_adam_step, 'py_func', None)
+	if py_func is None:
+		pytest.skip('numba is not installed, _adam_step is not compiled')
+
+	rng = np.random.default_rng(0)
+	sample = rng.uniform(size=4)
+	ms = np.zeros(4)
+	vs = np.zeros(4)
+	for _ in range(10):
+		grads = rng.normal(size=4).astype(np.float32).astype(ms.dtype)
+		compiled = _adam_step(sample, grads, ms, vs, 0.01, 0.9, 0.999, 1e-8)
+		reference = py_func(sample, grads, ms, vs, 0.01, 0.9, 0.999, 1e-8)
+		for compiled_array, reference_array in zip(compiled, reference):
+			np.testing.assert_allclose(compiled_array, reference_array, rtol=1e-12, atol=1e-15)
+		sample, ms, vs = reference
+
+
+def test_adam_optimizer_descends():
+	# the minimum of (x - 0.3)^2 in the first dimension, the second dimension is not optimized
+	opt = AdamOptimizer(func=lambda x: np.sum((x[:1] - 0.3)**2), select=[True, False], eta=0.05)
+	sample = np.array([0.8, 0.5])
+	for _ in range(200):
+		sample = opt.get_update(sample)
+	assert abs(sample[0] - 0.3) < 0.05
+	assert sample[1] == 0.5
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import numpy as np
+import torch
+
+from gryffin.utilities import ConfigParser
+from gryffin.bayesian_network.torch_interface.bnn import BNNTrainer
+
+
+def get_trainer():
+    config_dict = {
+        "general": {"verbosity": 0},
+        "parameters": [{"name": "param_0", "type": "continuous", "low": 0., "high": 1.},
+                       {"name": "param_1", "type": "discrete", "low": 0, "high": 4},
+                       {"name": "param_2", "type": "categorical", "category_details": {"a": None, "b": None, "c": None}}],
+        "objectives": [{"name": "obj", "goal": "min"}]
+    }
+    config = ConfigParser(config_dict=config_dict)
+    config.parse()
+    return BNNTrainer(config, config.model_details.to_dict(), frac_feas=1.)
+
+
+def get_observed_params(num_obs, seed):
+    rng = np.random.default_rng(seed)
+    # discrete and categorical params are given as option indices
+    return np.stack([rng.uniform(0., 1., num_obs),
+                     rng.integers(0, 5, num_obs),
+                     rng.integers(0, 3, num_obs)], axis=1).astype(np.float32)
+
+
+def assert_same_train_data(trainer, observed_params):
+    """train data generated by trainer, which may have cached features, must match that of a fresh trainer"""
+    features, targets = trainer._generate_train_data(torch.from_numpy(observed_params))
+    ref_features, ref_targets = get_trainer()._generate_train_data(torch.from_numpy(observed_params))
+    assert torch.equal(features, ref_features)
+    assert torch.equal(targets, ref_targets)
+
+
+def test_train_data_cache_appended_observations():
+    trainer = get_trainer()
+    observed_params = get_observed_params(num_obs=20, seed=0)
+    assert_same_train_data(trainer, observed_params[:5])
+    # growing beyond the buffer capacity more than once
+    assert_same_train_data(trainer, observed_params[:11])
+    assert_same_train_data(trainer, observed_params)
+
+
+def test_train_data_cache_changed_observations():
+    trainer = get_trainer()
+    observed_params = get_observed_params(num_obs=10, seed=0)
+    assert_same_train_data(trainer, observed_params)
+    changed_params = observed_params.copy()
+    changed_params[2] = get_observed_params(num_obs=1, seed=1)[0]
+    assert_same_train_data(trainer, changed_params)
+
+
+def test_train_data_cache_fewer_observations():
+    trainer = get_trainer()
+    observed_params = get_observed_params(num_obs=10, seed=0)
+    assert_same_train_data(trainer, observed_params)
+    assert_same_train_data(trainer, observed_params[:4])
+    # and back to the full set, after the cache was reset to the shorter one
+    assert_same_train_data(trainer, observed_params)
@@ -3,6 +3,7 @@
 import pytest
 import numpy as np
 from gryffin import Gryffin
+from gryffin.utilities import ConfigParser, compute_constrained_cartesian
 
 from gryffin.benchmark_functions import dejong, CatMichalewicz
 
@@ -145,5 +146,35 @@ def test_constraints_cat():
 		assert known_constraints_cat(obs)
 
 
+def get_cat_config(param_types=('categorical', 'categorical')):
+	parameters = []
+	for param_idx, param_type in enumerate(param_types):
+		if param_type == 'categorical':
+			parameters.append({"name": f"param_{param_idx}", "type": "categorical",
+							   "category_details": {f"x_{opt}": None for opt in range(3 - param_idx)}})
+		else:
+			parameters.append({"name": f"param_{param_idx}", "type": "continuous", "low": 0., "high": 1.})
+	config = ConfigParser(config_dict={"general": {"verbosity": 0}, "parameters": parameters,
+									   "objectives": [{"name": "obj", "goal": "min"}]})
+	config.parse()
+	return config
+
+def test_fully_categorical():
+	assert get_cat_config(('categorical', 'categorical')).fully_categorical
+	assert not get_cat_config(('categorical', 'continuous')).fully_categorical
+
+def test_constrained_cartesian():
+	config = get_cat_config()
+	# 3 x 2 options, as option indices
+	options = compute_constrained_cartesian(None, config)
+	assert isinstance(options, np.ndarray)
+	np.testing.assert_array_equal(options, [[0, 0], [0, 1], [1, 0], [1, 1], [2, 0], [2, 1]])
+
+	# the constraint is evaluated on the option names, and the feasible option indices are kept in order
+	known_constraints = lambda params: not (params['param_0'] == 'x_1' or params['param_1'] == 'x_0')
+	options = compute_constrained_cartesian(known_constraints, config)
+	assert isinstance(options, np.ndarray)
+	np.testing.assert_array_equal(options, [[0, 1], [2, 1]])
+
 if __name__ == '__main__':
 	test_constraints_cat()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from gryffin.utilities import ConfigParser
+from gryffin.acquisition.gradient_optimizer import GradientOptimizer
+
+
+def get_config():
+	config_dict = {
+		"general": {"verbosity": 0},
+		"parameters": [{"name": "param_0", "type": "continuous", "low": 0., "high": 1.},
+					   {"name": "param_1", "type": "continuous", "low": 0., "high": 1.}],
+		"objectives": [{"name": "obj", "goal": "min"}]
+	}
+	config = ConfigParser(config_dict=config_dict)
+	config.parse()
+	return config
+
+
+def known_constraints(params):
+	return params['param_0'] < 0.7
+
+
+def test_constrained_optimize_returns_last_feasible_iterate():
+	config = get_config()
+	# the minimum is outside of the feasible region, so the optimization stops at the constraint
+	func = lambda x: -np.sum(x)
+	sample = np.array([0.55, 0.4], dtype=np.float32)  # proposals from RandomSampler are float32
+
+	optimizer = GradientOptimizer(config, known_constraints)
+	optimizer.set_func(func)
+	optimized = optimizer._constrained_optimize_sample(sample, max_iter=100)
+
+	# reference: run the same Adam steps, keeping the last feasible iterate as is
+	ref_optimizer = GradientOptimizer(config, known_constraints)
+	ref_optimizer.set_func(func)
+	ref_optimized = sample.copy()
+	for _ in range(100):
+		candidate = ref_optimizer._project_sample_onto_bounds(ref_optimizer._single_opt_iteration(ref_optimized))
+		if not known_constraints({'param_0': candidate[0]}):
+			break
+		ref_optimized = candidate
+
+	assert optimized.dtype == np.float64
+	np.testing.assert_array_equal(optimized, ref_optimized)
+	assert known_constraints({'param_0': optimized[0]})
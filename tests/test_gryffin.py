@@ -49,3 +49,34 @@ def test_multiobjective():
 
     gryffin = Gryffin(config_dict=config)
     _ = gryffin.recommend(observations=observations)
+
+
+def test_eval_acquisition_batch():
+    config = {
+        "general": {
+            "save_database": False,
+            "num_cpus": 1,
+            "boosted": False,
+            "sampling_strategies": 2,
+            "random_seed": 42,
+        },
+        "parameters": [{"name": "param_0", "type": "continuous", "low": 0, "high": 1},
+                       {"name": "param_1", "type": "continuous", "low": 0, "high": 1}],
+        "objectives": [{"name": "obj", "goal": "min"}]
+        }
+
+    observations = [
+        {'param_0': 0.3, 'param_1': 0.4, 'obj': 0.1},
+        {'param_0': 0.5, 'param_1': 0.6, 'obj': 0.2},
+    ]
+
+    gryffin = Gryffin(config_dict=config)
+    _ = gryffin.recommend(observations=observations)
+
+    # the batched acquisition must give the same values as evaluating the samples one at a time
+    X = np.random.RandomState(0).uniform(size=(10, 2))
+    for batch_index in range(2):
+        acqs = gryffin.acquisition.eval_acquisition_batch(X, batch_index)
+        assert acqs.shape == (10,)
+        ref_acqs = [gryffin.acquisition.eval_acquisition(x, batch_index) for x in X]
+        np.testing.assert_allclose(acqs, ref_acqs)
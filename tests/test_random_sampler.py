@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from gryffin.utilities import ConfigParser
+from gryffin.random_sampler import RandomSampler
+
+
+def get_config():
+	config_dict = {
+		"general": {"verbosity": 0},
+		"parameters": [{"name": "param_0", "type": "continuous", "low": 0., "high": 1.},
+					   {"name": "param_1", "type": "discrete", "low": 0, "high": 4},
+					   {"name": "param_2", "type": "categorical", "category_details": {"a": None, "b": None, "c": None}}],
+		"objectives": [{"name": "obj", "goal": "min"}]
+	}
+	config = ConfigParser(config_dict=config_dict)
+	config.parse()
+	return config
+
+
+def test_same_seed_same_draws():
+	config = get_config()
+	sampler_0 = RandomSampler(config, seed=42)
+	sampler_1 = RandomSampler(config, seed=42)
+	samples = sampler_0.draw(num=20)
+	np.testing.assert_array_equal(samples, sampler_1.draw(num=20))
+	ref_sample = samples[0]
+	np.testing.assert_array_equal(sampler_0.perturb(ref_sample, num=5), sampler_1.perturb(ref_sample, num=5))
+
+
+def test_different_seeds_different_draws():
+	config = get_config()
+	samples_0 = RandomSampler(config, seed=0).draw(num=20)
+	samples_1 = RandomSampler(config, seed=1).draw(num=20)
+	assert not np.array_equal(samples_0, samples_1)
+
+
+def test_no_seed_follows_global_random_state():
+	config = get_config()
+	# without a seed, each sampler draws its seed from the global numpy random state
+	np.random.seed(0)
+	samples_0 = RandomSampler(config).draw(num=20)
+	samples_1 = RandomSampler(config).draw(num=20)
+	assert not np.array_equal(samples_0, samples_1)
+	# so results are still reproducible when the global random state is seeded
+	np.random.seed(0)
+	np.testing.assert_array_equal(RandomSampler(config).draw(num=20), samples_0)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from gryffin.utilities import ConfigParser
+from gryffin.sample_selector import SampleSelector
+
+
+def get_categorical_selector():
+	config_dict = {
+		"general": {"verbosity": 0},
+		"parameters": [{"name": "param_0", "type": "categorical", "category_details": {"a": None, "b": None, "c": None}},
+					   {"name": "param_1", "type": "categorical", "category_details": {"a": None, "b": None}}],
+		"objectives": [{"name": "obj", "goal": "min"}]
+	}
+	config = ConfigParser(config_dict=config_dict)
+	config.parse()
+	return SampleSelector(config)
+
+
+def get_continuous_selector():
+	config_dict = {
+		"general": {"verbosity": 0},
+		"parameters": [{"name": "param_0", "type": "continuous", "low": 0., "high": 1.},
+					   {"name": "param_1", "type": "continuous", "low": 0., "high": 1.}],
+		"objectives": [{"name": "obj", "goal": "min"}]
+	}
+	config = ConfigParser(config_dict=config_dict)
+	config.parse()
+	return SampleSelector(config)
+
+
+def get_categorical_proposals(num_proposals, seed):
+	# option indices of the 3 x 2 = 6 possible proposals, so there are many duplicates
+	rng = np.random.default_rng(seed)
+	return np.stack([rng.integers(0, 3, num_proposals), rng.integers(0, 2, num_proposals)], axis=1).astype(np.float64)
+
+
+def eval_acquisition(samples, sampling_param_idx):
+	# identical samples have identical acquisition values, and some distinct samples tie
+	return -np.sum(samples * np.array([1., 1.5]), axis=1)
+
+
+def sequential_top_indices(log_rewards, duplicate_ids, num_samples):
+	"""pick num_samples proposals one at a time, excluding the duplicates of each selected proposal"""
+	log_rewards = log_rewards.copy()
+	indices = []
+	for _ in range(num_samples):
+		index = np.argmax(log_rewards)
+		indices.append(index)
+		log_rewards[duplicate_ids == duplicate_ids[index]] = -np.inf
+	return np.array(indices)
+
+
+def test_top_distinct_indices_heavy_duplicates():
+	proposals = get_categorical_proposals(num_proposals=200, seed=0)
+	duplicate_ids = SampleSelector.get_duplicate_ids(proposals[None])[0]
+	log_rewards = -eval_acquisition(proposals, 0)
+	log_rewards[duplicate_ids == duplicate_ids[0]] = -np.inf  # e.g. proposals that were already observed
+	num_distinct = len(np.unique(duplicate_ids)) - 1
+	for num_samples in range(1, num_distinct + 1):
+		top_indices = SampleSelector._top_distinct_indices(log_rewards, duplicate_ids, num_samples)
+		np.testing.assert_array_equal(top_indices, sequential_top_indices(log_rewards, duplicate_ids, num_samples))
+
+
+def test_top_distinct_indices_too_few_distinct():
+	proposals = get_categorical_proposals(num_proposals=200, seed=0)
+	duplicate_ids = SampleSelector.get_duplicate_ids(proposals[None])[0]
+	log_rewards = -eval_acquisition(proposals, 0)
+	num_distinct = len(np.unique(duplicate_ids))
+	assert SampleSelector._top_distinct_indices(log_rewards, duplicate_ids, num_distinct + 1) is None
+
+
+def test_select_single_strategy_matches_sequential_selection(monkeypatch):
+	obs_params = np.array([[0., 0.], [2., 1.]])
+	for num_batches in [1, 3, 4, 6]:
+		proposals = get_categorical_proposals(num_proposals=50, seed=num_batches)[None]
+		sampling_param_values = np.array([1])
+		samples = get_categorical_selector().select(num_batches, proposals, eval_acquisition,
+													sampling_param_values, obs_params)
+
+		# the same selection, with the one-at-a-time loop used for several sampling strategies
+		with monkeypatch.context() as m:
+			m.setattr(SampleSelector, '_top_distinct_indices', staticmethod(lambda *args: None))
+			ref_samples = get_categorical_selector().select(num_batches, proposals, eval_acquisition,
+															sampling_param_values, obs_params)
+		np.testing.assert_array_equal(samples, ref_samples)
+
+
+def test_select_with_underflowing_rewards():
+	obs_params = np.array([[0.5, 0.5]])
+	proposals = np.array([[[0.1, 0.1], [0.5, 0.5], [0.9, 0.2], [0.3, 0.8]]])
+	# exp(-acq) underflows to zero for all proposals, so they can only be told apart by their log rewards.
+	# Differences in acquisition values are larger than any diversity penalty
+	acqs = np.array([1030., 1000., 1010., 1020.])
+	samples = get_continuous_selector().select(1, proposals, lambda samples, idx: acqs, np.array([1]), obs_params)
+	# the proposal identical to the observation is never selected, even if it has the best acquisition
+	np.testing.assert_array_equal(samples, [[0.9, 0.2]])
+
+	# with two batches, the second best proposal is selected next
+	samples = get_continuous_selector().select(2, proposals, lambda samples, idx: acqs, np.array([1]), obs_params)
+	np.testing.assert_array_equal(samples, [[0.9, 0.2], [0.3, 0.8]])